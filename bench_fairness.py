@@ -0,0 +1,104 @@
+"""Tenant latency under a flooding user, per update processor.
+
+Replays the same update stream through the processor PTB uses by default
+(one update at a time), plain concurrency and FairUpdateProcessor. Tenants
+send one update each per tick. Every handler spends a fixed time in I/O.
+With --flood, one extra user pushes that many updates at once at the start.
+FairUpdateProcessor handles up to MAX_QUEUED_UPDATES_PER_USER of them and
+drops the rest. A forwarded batch (--flood 100) gets through whole.
+
+    python bench_fairness.py --tenants 20 --ticks 100 --flood 2000
+"""
+import os
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+
+from cryptography.fernet import Fernet
+from telegram import Chat, Message, Update, User
+from telegram.ext import SimpleUpdateProcessor
+
+os.environ.setdefault('TOKEN_ENCRYPTION_KEY', Fernet.generate_key().decode())
+
+import smmtgg
+
+FLOODER_ID = 999999
+
+def make_update(update_id, user_id):
+    user = User(user_id, f"user{user_id}", False)
+    message = Message(update_id, datetime.now(), Chat(user_id, Chat.PRIVATE), from_user=user, text="photo")
+    return Update(update_id, message=message)
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def run(processor, args):
+    """Feed the stream into processor the way Application does, return latencies by user"""
+    latencies = {}
+    handled = {}
+
+    async def handler(user_id, arrived):
+        await asyncio.sleep(args.handler_ms / 1000)
+        latencies.setdefault(user_id, []).append((time.perf_counter() - arrived) * 1000)
+        handled[user_id] = handled.get(user_id, 0) + 1
+
+    def deliver(update):
+        arrived = time.perf_counter()
+        coroutine = handler(update.effective_user.id, arrived)
+        return asyncio.create_task(processor.process_update(update, coroutine))
+
+    await processor.initialize()
+    tasks = []
+    update_id = 0
+    for _ in range(args.flood):
+        update_id += 1
+        tasks.append(deliver(make_update(update_id, FLOODER_ID)))
+    for _ in range(args.ticks):
+        for tenant in range(1, args.tenants + 1):
+            update_id += 1
+            tasks.append(deliver(make_update(update_id, tenant)))
+        await asyncio.sleep(args.tick_ms / 1000)
+    await asyncio.gather(*tasks)
+    await processor.shutdown()
+
+    tenant_latencies = [ms for user_id, values in latencies.items() if user_id != FLOODER_ID for ms in values]
+    return {
+        "tenant_p50_ms": round(percentile(tenant_latencies, 0.5), 1),
+        "tenant_p99_ms": round(percentile(tenant_latencies, 0.99), 1),
+        "tenant_updates_handled": len(tenant_latencies),
+        "flooder_updates_handled": handled.get(FLOODER_ID, 0),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare update processors under a flooding user")
+    parser.add_argument('--tenants', type=int, default=20)
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--tick-ms', type=float, default=20)
+    parser.add_argument('--handler-ms', type=float, default=5, help="time each handler spends in I/O")
+    parser.add_argument('--flood', type=int, default=2000, help="updates the flooding user sends at the start")
+    args = parser.parse_args()
+
+    # Dropped flooder updates are expected here
+    logging.getLogger(smmtgg.__name__).setLevel(logging.ERROR)
+
+    processors = {
+        "sequential (PTB default)": lambda: SimpleUpdateProcessor(1),
+        f"plain concurrency x{smmtgg.MAX_CONCURRENT_UPDATES}": lambda: SimpleUpdateProcessor(smmtgg.MAX_CONCURRENT_UPDATES),
+        "FairUpdateProcessor": smmtgg.FairUpdateProcessor,
+    }
+    report = {}
+    for name, make_processor in processors.items():
+        report[name] = {
+            "idle": asyncio.run(run(make_processor(), argparse.Namespace(**{**vars(args), "flood": 0}))),
+            "flooding": asyncio.run(run(make_processor(), args)),
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Handler latency with synchronous vs queued logging.
+
+Runs the Pending Posts handler against a seeded database. Logging goes to a
+sink whose writes block for a set time, like a slow pipe or log shipper. Each
+handler call logs the way it does in production: the handler's own lines plus
+the per-request line httpx emits for the reply.
+
+    python bench_logging.py --calls 2000 --write-delay-ms 0.5
+"""
+import os
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+import types
+
+from cryptography.fernet import Fernet
+
+os.environ.setdefault('TOKEN_ENCRYPTION_KEY', Fernet.generate_key().decode())
+
+import smmtgg
+
+class SlowStream:
+    """Log sink whose writes block the writing thread"""
+    def __init__(self, delay):
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+class FakeMessage:
+    async def reply_text(self, text, **kwargs):
+        # PTB's HTTP client logs every Bot API request at INFO
+        logging.getLogger('httpx').info('HTTP Request: POST https://api.telegram.org/bot.../sendMessage "HTTP/1.1 200 OK"')
+
+def use_sync_logging(stream):
+    """The previous setup - format and write on the calling thread"""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(smmtgg.JsonFormatter())
+    handler.addFilter(smmtgg.SamplingFilter())
+    handler.addFilter(smmtgg.ContextFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def time_handler(bot, calls):
+    update = types.SimpleNamespace(effective_user=types.SimpleNamespace(id=1), message=FakeMessage())
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await bot.pending_posts(update, None)
+        smmtgg.logger.info("Pending posts shown")
+        timings.append((time.perf_counter() - started) * 1e6)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare handler latency with synchronous and queued logging")
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--write-delay-ms', type=float, default=0.5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = smmtgg.SMMBot(
+            db_path=os.path.join(tmp, 'bench.db'), archive_path=os.path.join(tmp, 'bench_archive.db'),
+            run_scheduler=False
+        )
+        bot.cursor.execute('INSERT INTO settings (user_id) VALUES (1)')
+        bot.cursor.executemany(
+            'INSERT INTO posts (user_id, content_type, file_id, caption, caption_preview) VALUES (1, ?, ?, ?, ?)',
+            [('photo', f'file_{i}', f'Post {i}', smmtgg.caption_preview(f'Post {i}')) for i in range(50)]
+        )
+        bot.conn.commit()
+
+        stream = SlowStream(args.write_delay_ms / 1000)
+        results = {}
+        use_sync_logging(stream)
+        results['synchronous StreamHandler'] = asyncio.run(time_handler(bot, args.calls))
+        smmtgg.setup_logging(stream)
+        results['QueueHandler + QueueListener'] = asyncio.run(time_handler(bot, args.calls))
+        smmtgg.stop_logging()
+
+    print(f"{args.calls} handler calls, sink write delay {args.write_delay_ms}ms")
+    for name, timings in results.items():
+        print(f"{name:30s} mean {sum(timings) / len(timings):8.1f} us   p99 {percentile(timings, 0.99):8.1f} us")
+
+if __name__ == '__main__':
+    main()
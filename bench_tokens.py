@@ -0,0 +1,94 @@
+"""Dispatch throughput with plaintext vs encrypted bot tokens.
+
+Seeds the same tenants as simulate.py and runs the dispatcher on the virtual
+clock against the fake Bot API, three times:
+
+- plaintext: tokens stored in the clear and read with one SELECT per send,
+  as before the tokens were encrypted
+- vault: encrypted tokens through the cache with TOKEN_CACHE_TTL
+- vault, no cache: every send reads and decrypts the token
+
+Only the time spent in dispatch_due_posts is counted, best of --repeat runs.
+
+    python bench_tokens.py --tenants 1000 --days 2
+"""
+import argparse
+import logging
+import random
+import time
+from datetime import datetime
+
+import simulate
+import smmtgg
+
+class PlaintextBot(smmtgg.SMMBot):
+    """Reads tokens the way the bot did before they were encrypted"""
+    def get_bot_token(self, user_id):
+        with self.job_lock:
+            cursor = self.job_conn.cursor()
+            cursor.execute('SELECT bot_token FROM users WHERE user_id = ?', (user_id,))
+            result = cursor.fetchone()
+        return result[0] if result else None
+
+def run(bot_class, args, ttl):
+    rng = random.Random(args.seed)
+    clock = simulate.VirtualClock(datetime(2024, 1, 1))
+    api = simulate.FakeBotAPI(clock, seed=args.seed)
+    memory_db = f"file:benchtokens_{time.monotonic_ns()}"
+    bot = bot_class(
+        db_path=f"{memory_db}?mode=memory&cache=shared", archive_path=f"{memory_db}_archive?mode=memory&cache=shared",
+        clock=clock, http=api, run_scheduler=False, timer=clock.monotonic
+    )
+    bot.token_cache.ttl = ttl
+    simulate.seed_tenants(bot, args.tenants, args.days, clock(), rng)
+    if bot_class is PlaintextBot:
+        bot.conn.execute("UPDATE users SET bot_token = user_id || ':SIMTOKEN'")
+        bot.conn.commit()
+
+    elapsed = 0.0
+    for _ in range(args.days * 24 * 60):
+        clock.advance(60)
+        started = time.perf_counter()
+        bot.dispatch_due_posts()
+        elapsed += time.perf_counter() - started
+
+    api_calls = sum(api.status_counts.values())
+    return {
+        "dispatch_seconds": round(elapsed, 2),
+        "api_calls": api_calls,
+        "api_calls_per_second": round(api_calls / elapsed),
+        "cache_hits": bot.token_cache.hits,
+        "cache_misses": bot.token_cache.misses,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dispatch throughput with plaintext and encrypted tokens")
+    parser.add_argument('--tenants', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger(smmtgg.__name__).setLevel(logging.ERROR)
+
+    runs = {
+        "plaintext": (PlaintextBot, smmtgg.TOKEN_CACHE_TTL),
+        f"vault, ttl {smmtgg.TOKEN_CACHE_TTL}s": (smmtgg.SMMBot, smmtgg.TOKEN_CACHE_TTL),
+        "vault, no cache": (smmtgg.SMMBot, 0),
+    }
+    # Interleave the runs so drift in machine load hits all of them alike
+    reports = {name: [] for name in runs}
+    for _ in range(args.repeat):
+        for name, (bot_class, ttl) in runs.items():
+            reports[name].append(run(bot_class, args, ttl))
+
+    print(f"{args.tenants} tenants, {args.days} virtual days")
+    for name, results in reports.items():
+        report = min(results, key=lambda r: r["dispatch_seconds"])
+        print(
+            f"{name:22s} {report['dispatch_seconds']:7.2f}s  {report['api_calls_per_second']:7d} calls/s  "
+            f"cache {report['cache_hits']} hits / {report['cache_misses']} misses"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""Deterministic simulation of the posting pipeline on a virtual clock.
+
+Runs SMMBot.dispatch_due_posts once per virtual minute, the same as the
+production scheduler, against an in-memory database and an in-process fake
+Bot API. Each API call can take virtual time, so a slow API makes ticks
+overrun their minute. Reports throughput, tick overruns, schedule drift and
+queue lag per tenant.
+
+Ticks with nothing due cost about 10us, so run time follows the number of
+posts sent - about 0.2ms each, mostly SQLite. A week with 10k tenants sends
+~270k posts and takes about a minute. --profile shows where the time goes.
+
+    python simulate.py --tenants 10000 --days 7 --send-latency-ms 50
+"""
+import os
+import argparse
+import cProfile
+import json
+import logging
+import pstats
+import random
+import sys
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+
+from cryptography.fernet import Fernet
+
+# The simulation never touches real tokens
+os.environ.setdefault('TOKEN_ENCRYPTION_KEY', Fernet.generate_key().decode())
+
+import smmtgg
+
+# Telegram allows about 20 messages per minute into one group or channel
+CHAT_LIMIT_PER_MINUTE = 20
+
+class VirtualClock:
+    """Stands in for datetime.now, only moves when advanced"""
+    def __init__(self, start):
+        self.current = start
+
+    def __call__(self):
+        return self.current
+
+    def advance(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+    def monotonic(self):
+        """Stands in for time.monotonic"""
+        return self.current.timestamp()
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def json(self):
+        if self.retry_after is None:
+            return {"ok": self.status_code == 200}
+        return {"ok": False, "parameters": {"retry_after": self.retry_after}}
+
+class FakeBotAPI:
+    """In-process stand-in for the Bot API send methods, used as SMMBot.http.
+
+    Every call advances the clock by latency seconds, plus up to jitter seconds more.
+    """
+    def __init__(self, clock, failure_rate=0.0, seed=0, latency=0.0, jitter=0.0):
+        self.clock = clock
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.recent = defaultdict(deque)
+        self.status_counts = defaultdict(int)
+
+    def post(self, url, json=None, timeout=None):
+        now = self.clock()
+        window = self.recent[json["chat_id"]]
+        while window and window[0] <= now - timedelta(minutes=1):
+            window.popleft()
+
+        retry_after = None
+        if len(window) >= CHAT_LIMIT_PER_MINUTE:
+            status_code = 429
+            retry_after = int((window[0] + timedelta(minutes=1) - now).total_seconds()) + 1
+        elif self.random.random() < self.failure_rate:
+            status_code = 500
+        else:
+            window.append(now)
+            status_code = 200
+
+        self.status_counts[status_code] += 1
+        if self.latency or self.jitter:
+            self.clock.advance(self.latency + self.random.uniform(0, self.jitter))
+        return FakeResponse(status_code, retry_after)
+
+class SimulatedBot(smmtgg.SMMBot):
+    """SMMBot that records when each post was due and when it went out"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_due = {}
+        self.sent_count = defaultdict(int)
+        self.max_lag = defaultdict(float)
+        self.drift = {}
+
+    def schedule_next_post(self, user_id, posts_per_day, due_at, retry_in=None):
+        if due_at and not retry_in:
+            now = self.clock()
+            due = datetime.fromisoformat(due_at)
+            self.max_lag[user_id] = max(self.max_lag[user_id], (now - due).total_seconds())
+
+            # Drift against the ideal grid starting at the first slot
+            first_due = self.first_due.setdefault(user_id, due)
+            ideal = first_due + timedelta(seconds=self.sent_count[user_id] * 86400 / posts_per_day)
+            self.drift[user_id] = (now - ideal).total_seconds()
+            self.sent_count[user_id] += 1
+
+        super().schedule_next_post(user_id, posts_per_day, due_at, retry_in)
+
+def seed_tenants(bot, tenants, days, start, rng):
+    """Create tenants with random settings, channels and post queues"""
+    users, settings, channels, posts = [], [], [], []
+    channel_id = 0
+
+    for user_id in range(1, tenants + 1):
+        posts_per_day = rng.choice((1, 2, 3, 4, 5, 6, 8, 10))
+        repost_enabled = rng.random() < 0.5
+        # Tenants join at random points of their first interval
+        next_post_at = start + timedelta(seconds=rng.uniform(0, 86400 / posts_per_day))
+
+        users.append((user_id, bot.fernet.encrypt(f"{user_id}:SIMTOKEN".encode()).decode()))
+        settings.append((user_id, posts_per_day, repost_enabled, next_post_at.strftime('%Y-%m-%d %H:%M:%S')))
+
+        channel_ids = []
+        for k in range(rng.randint(1, 3)):
+            channel_id += 1
+            channel_ids.append(str(channel_id))
+            channels.append((channel_id, user_id, f"@sim_{user_id}_{k}", f"Sim {user_id}/{k}"))
+
+        # Repost tenants cycle a short queue, the others may run dry mid-week
+        queue_size = rng.randint(3, 10) if repost_enabled else rng.randint(1, int(posts_per_day * days * 1.2) + 1)
+        posts += [(user_id, 'photo', f"sim_{user_id}_{i}", f"Post {i}", json.dumps(channel_ids)) for i in range(queue_size)]
+
+    bot.conn.executemany('INSERT INTO users (user_id, bot_token) VALUES (?, ?)', users)
+    bot.conn.executemany(
+        'INSERT INTO settings (user_id, posts_per_day, repost_enabled, next_post_at) VALUES (?, ?, ?, ?)',
+        settings
+    )
+    bot.conn.executemany(
+        'INSERT INTO channels (id, user_id, channel_username, channel_title) VALUES (?, ?, ?, ?)',
+        channels
+    )
+    bot.conn.executemany(
+        'INSERT INTO posts (user_id, content_type, file_id, caption, target_channels) VALUES (?, ?, ?, ?, ?)',
+        posts
+    )
+    bot.conn.commit()
+    return len(posts)
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def run_simulation(tenants=10000, days=7, seed=0, failure_rate=0.0, db_path=None, send_latency=0.0, send_jitter=0.0):
+    """Simulate the dispatcher for the given number of virtual days and return a report"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    clock = VirtualClock(start)
+    api = FakeBotAPI(clock, failure_rate, seed, send_latency, send_jitter)
+    memory_db = f"file:smmsim{seed}_{time.monotonic_ns()}"
+    bot = SimulatedBot(
+        db_path=db_path or f"{memory_db}?mode=memory&cache=shared",
+        archive_path=f"{db_path}.archive" if db_path else f"{memory_db}_archive?mode=memory&cache=shared",
+        clock=clock, http=api, run_scheduler=False, timer=clock.monotonic
+    )
+    queued = seed_tenants(bot, tenants, days, clock(), rng)
+
+    started = time.perf_counter()
+    max_tick = 0.0
+    ticks, overruns, skipped_ticks = 0, 0, 0
+    virtual_tick_lengths = []
+    end = start + timedelta(days=days)
+    next_tick = start + timedelta(minutes=1)
+    while next_tick <= end:
+        clock.advance((next_tick - clock()).total_seconds())
+        tick_started = time.perf_counter()
+        bot.dispatch_due_posts()
+        max_tick = max(max_tick, time.perf_counter() - tick_started)
+        ticks += 1
+
+        virtual_tick = round((clock() - next_tick).total_seconds(), 3)
+        virtual_tick_lengths.append(virtual_tick)
+        next_tick += timedelta(minutes=1)
+        if virtual_tick > 60:
+            # Like the scheduler job (max_instances=1), runs due while a tick is
+            # still going are skipped and the next one starts on the following boundary
+            overruns += 1
+            while next_tick <= clock():
+                next_tick += timedelta(minutes=1)
+                skipped_ticks += 1
+    elapsed = time.perf_counter() - started
+
+    posts_sent = sum(bot.sent_count.values())
+    api_calls = sum(api.status_counts.values())
+    lags = list(bot.max_lag.values())
+    drifts = [abs(d) for d in bot.drift.values()]
+    return {
+        "tenants": tenants,
+        "virtual_days": days,
+        "posts_queued": queued,
+        "wall_seconds": round(elapsed, 2),
+        "posts_sent": posts_sent,
+        "api_calls": api_calls,
+        "api_status": dict(api.status_counts),
+        "token_cache": {"hits": bot.token_cache.hits, "misses": bot.token_cache.misses},
+        "median_send_latency_ms": bot.get_global_stats()["median_latency_ms"],
+        "api_calls_per_wall_second": round(api_calls / elapsed) if elapsed else None,
+        "posts_per_virtual_day": round(posts_sent / days),
+        "max_tick_ms": round(max_tick * 1000, 1),
+        "ticks": ticks,
+        "tick_overruns": overruns,
+        "ticks_skipped": skipped_ticks,
+        "virtual_tick_s": {
+            "p50": percentile(virtual_tick_lengths, 0.5), "p99": percentile(virtual_tick_lengths, 0.99),
+            "max": max(virtual_tick_lengths, default=0)
+        },
+        "queue_lag_per_tenant_s": {
+            "p50": percentile(lags, 0.5), "p99": percentile(lags, 0.99), "max": max(lags, default=0)
+        },
+        "schedule_drift_per_tenant_s": {
+            "p50": percentile(drifts, 0.5), "p99": percentile(drifts, 0.99), "max": max(drifts, default=0)
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the posting scheduler on a virtual clock")
+    parser.add_argument('--tenants', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of sends the fake API fails")
+    parser.add_argument('--send-latency-ms', type=float, default=0.0, help="virtual time each fake API call takes")
+    parser.add_argument('--send-jitter-ms', type=float, default=0.0, help="extra random latency per call, up to this much")
+    parser.add_argument('--db', help="SQLite file to use instead of an in-memory database")
+    parser.add_argument('--profile', action='store_true', help="print the most expensive functions to stderr")
+    args = parser.parse_args()
+
+    # Per-send failures are expected here, only keep errors
+    logging.getLogger(smmtgg.__name__).setLevel(logging.ERROR)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    report = run_simulation(
+        args.tenants, args.days, args.seed, args.failure_rate, args.db,
+        args.send_latency_ms / 1000, args.send_jitter_ms / 1000
+    )
+    if profiler:
+        profiler.disable()
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('tottime').print_stats(15)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,182 @@
 import os
+import sys
 import asyncio
 import logging
+import logging.handlers
+import queue
+import random
+import atexit
+import functools
 import sqlite3
 import json
+import bisect
 from datetime import datetime, timedelta
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
+from telegram.helpers import escape_markdown
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler, BaseUpdateProcessor
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 import requests
 
 # Flask keep-alive server
 from flask import Flask
-from threading import Thread
+from threading import Thread, Lock
 import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from cryptography.fernet import Fernet
 
 # Set up logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Fraction of high-volume events (e.g. successful sends) that get logged
+SEND_LOG_SAMPLE_RATE = float(os.environ.get('SEND_LOG_SAMPLE_RATE', '0.01'))
+
+# Record attributes copied into every JSON log line when present
+LOG_FIELDS = ("user_id", "handler", "post_id", "event", "latency_ms", "rejected")
+
+# Correlation ids of the update or job currently being processed
+log_context = ContextVar('log_context', default={})
+
+class JsonFormatter(logging.Formatter):
+    """Render log records as one JSON object per line"""
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Drop records logged with a sample_rate below 1 at that rate"""
+    def filter(self, record):
+        return random.random() < getattr(record, 'sample_rate', 1)
+
+class ContextFilter(logging.Filter):
+    """Attach the current correlation ids to the record"""
+    def filter(self, record):
+        for key, value in log_context.get().items():
+            if getattr(record, key, None) is None:
+                setattr(record, key, value)
+        return True
+
+# Queue listener started by setup_logging
+log_listener = None
+
+def stop_logging():
+    """Flush and stop the queue listener, safe to call more than once"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+atexit.register(stop_logging)
+
+def setup_logging(stream=None):
+    """Send all logs through a queue so stream I/O happens off the calling thread.
+    
+    Calling it again replaces the previous listener.
+    """
+    global log_listener
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    
+    # Filters run in the emitting thread, where the context is visible
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(ContextFilter())
+    
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(JsonFormatter())
+    
+    log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    log_listener.start()
+    
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(logging.INFO)
+    return log_listener
+
+def with_log_context(handler):
+    """Tag logs emitted while a handler runs with the user and handler name"""
+    @functools.wraps(handler)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        token = log_context.set({"user_id": user.id if user else None, "handler": handler.__name__})
+        try:
+            return await handler(self, update, context)
+        finally:
+            log_context.reset(token)
+    return wrapper
+
 logger = logging.getLogger(__name__)
 
-# Your bot token
-BOT_TOKEN = "8217960293:AAEedCXGMiAHIQavwd-jpFJZqpXvRXBqCLA"
+# Master bot token
+BOT_TOKEN = os.environ.get('BOT_TOKEN')
+
+# Fernet key used to encrypt users' bot tokens at rest
+TOKEN_ENCRYPTION_KEY = os.environ.get('TOKEN_ENCRYPTION_KEY')
+
+# Decrypted user bot tokens kept in memory for the posting path
+TOKEN_CACHE_SIZE = 16384
+# Longer than the longest posting interval (1 post a day), so a scheduled
+# user's token is still cached at their next send
+TOKEN_CACHE_TTL = 90000  # seconds
+
+# Per-user admission for heavy handlers (token bucket) - the burst fits the
+# largest batch Telegram lets a user forward at once
+RATE_LIMIT_BURST = 100
+RATE_LIMIT_PER_SEC = 1.0
+RATE_LIMITER_SIZE = 16384  # users tracked, idle ones are evicted first
+
+# Update intake - updates of different users run concurrently,
+# each user's updates run in order and only a bounded number may wait.
+# A full forwarded batch must fit in one user's queue.
+MAX_CONCURRENT_UPDATES = 16
+MAX_QUEUED_UPDATES_PER_USER = 2 * RATE_LIMIT_BURST
+MAX_QUEUED_UPDATES = 5000  # all users together
+
+# Database file
+DB_PATH = os.environ.get('SMM_DB_PATH', 'smm_bot.db')
+
+# Sent posts older than the retention move to the archive database,
+# a batch at a time so the hot posts table stays small
+ARCHIVE_DB_PATH = os.environ.get('SMM_ARCHIVE_DB_PATH', 'smm_bot_archive.db')
+POST_RETENTION_DAYS = int(os.environ.get('POST_RETENTION_DAYS', '30'))
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_MAX_BATCHES = 20  # per run
 
 # Conversation states
 MAIN_MENU, SETUP_BOT, SETUP_CHANNELS, BULK_POSTS, POSTS_PER_DAY = range(5)
 
+# Menu previews
+CAPTION_PREVIEW_LENGTH = 30
+PENDING_PREVIEW_LIMIT = 50
+
+# Stats rollups - row user_id 0 holds the service-wide totals
+GLOBAL_STATS_USER = 0
+# Send latency histogram bucket upper bounds (ms), slower sends land in the last one
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Posts whose sends all failed with a transient error (429, 5xx, network)
+# stay pending and are retried with exponential backoff
+MAX_SEND_RETRIES = 5
+SEND_RETRY_DELAY = 60  # seconds, doubled on each retry
+
+# Bot API send method and media field per content type
+SEND_METHODS = {
+    "photo": ("sendPhoto", "photo"),
+    "video": ("sendVideo", "video"),
+    "document": ("sendDocument", "document"),
+}
+
+# Running bot instance, used by the keep-alive server for /status
+smm_bot_instance = None
+
 # Flask Keep-Alive Server
 app = Flask('')
 
@@ -49,7 +198,8 @@ def status():
         "status": "active",
         "service": "Telegram SMM Bot",
         "uptime": time.time(),
-        "features": ["Auto-posting", "Multi-channel", "Bulk upload", "Repost mode"]
+        "features": ["Auto-posting", "Multi-channel", "Bulk upload", "Repost mode"],
+        "stats": smm_bot_instance.get_global_stats() if smm_bot_instance else None
     }
 
 def run_flask():
@@ -60,7 +210,7 @@ def keep_alive():
     server = Thread(target=run_flask)
     server.daemon = True
     server.start()
-    print("🔄 Keep-alive server started on port 8080")
+    logger.info("🔄 Keep-alive server started on port 8080")
 
 # Self-pinging function
 def start_self_ping():
@@ -69,27 +219,229 @@ def start_self_ping():
         while True:
             try:
                 requests.get("https://smmtggbot.onrender.com/health", timeout=10)
-                print(f"✅ Self-ping at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+                logger.debug("✅ Self-ping ok")
             except Exception as e:
-                print(f"⚠️ Self-ping failed: {e}")
+                logger.warning(f"⚠️ Self-ping failed: {e}")
             time.sleep(300)  # 5 minutes
     
     ping_thread = Thread(target=ping_loop, daemon=True)
     ping_thread.start()
-    print("🔄 Self-pinging system started")
+    logger.info("🔄 Self-pinging system started")
+
+def caption_preview(caption):
+    """Short Markdown-safe preview of a caption, stored with the post at ingestion"""
+    if not caption:
+        return "No caption"
+    caption = ' '.join(caption.split())
+    if len(caption) > CAPTION_PREVIEW_LENGTH:
+        caption = caption[:CAPTION_PREVIEW_LENGTH] + "..."
+    return escape_markdown(caption)
+
+class TokenCache:
+    """Bounded LRU cache of decrypted bot tokens, entries expire ttl seconds after their last use"""
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, user_id):
+        now = self.timer()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[1] < now:
+                self.entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self.entries[user_id] = (entry[0], now + self.ttl)
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, user_id, token):
+        with self.lock:
+            self.entries[user_id] = (token, self.timer() + self.ttl)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+class RateLimiter:
+    """Per-user token buckets, idle users are evicted beyond maxsize"""
+    def __init__(self, rate=RATE_LIMIT_PER_SEC, burst=RATE_LIMIT_BURST, maxsize=RATE_LIMITER_SIZE, timer=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.timer = timer
+        self.buckets = OrderedDict()
+        self.lock = Lock()
+    
+    def allow(self, user_id):
+        """Take one token - returns (allowed, rejected).
+        
+        While throttled, rejected counts the updates rejected so far in the streak.
+        On the first allowed update after a streak it is the streak's total, else 0.
+        """
+        now = self.timer()
+        with self.lock:
+            tokens, updated_at, rejected = self.buckets.pop(user_id, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                rejected += 1
+            self.buckets[user_id] = (tokens, now, 0 if allowed else rejected)
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+            return allowed, rejected
+    
+    def reject(self, user_id):
+        """Count an update dropped before it reached allow() into the user's streak"""
+        now = self.timer()
+        with self.lock:
+            tokens, updated_at, rejected = self.buckets.pop(user_id, (self.burst, now, 0))
+            self.buckets[user_id] = (tokens, updated_at, rejected + 1)
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+
+def with_rate_limit(handler):
+    """Reject updates from users that exceed their token bucket, keeping the conversation state"""
+    @functools.wraps(handler)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        allowed, rejected = self.rate_limiter.allow(update.effective_user.id)
+        if allowed:
+            # The streak is over, say how much of it was lost
+            if rejected and update.message:
+                await update.message.reply_text(
+                    f"⚠️ *{rejected} message(s) were not saved*\n\n"
+                    "They arrived while you were sending too fast. Please send them again.",
+                    parse_mode='Markdown'
+                )
+            return await handler(self, update, context)
+        
+        logger.warning("Update rejected by rate limit", extra={"event": "rate_limited", "rejected": rejected})
+        # Only tell the user once per throttled streak, the total follows when it ends
+        if rejected == 1 and update.message:
+            await update.message.reply_text(
+                "⏳ *Slow down!*\n\n"
+                "You're sending too fast, so what you send now is not saved. "
+                "Wait a moment - I'll tell you how many messages were skipped.",
+                parse_mode='Markdown'
+            )
+        return None
+    return wrapper
+
+class FairUpdateProcessor(BaseUpdateProcessor):
+    """Process different users' updates concurrently and each user's updates in order.
+    
+    A user can hold at most one worker slot, so a flooding user cannot starve the
+    others. Updates beyond MAX_QUEUED_UPDATES_PER_USER waiting for one user, or
+    MAX_QUEUED_UPDATES waiting in total, are dropped and reported to on_drop(user_id).
+    Serializing per user also keeps the ConversationHandler state consistent.
+    """
+    def __init__(
+        self, max_concurrent_updates=MAX_CONCURRENT_UPDATES,
+        max_queued_per_user=MAX_QUEUED_UPDATES_PER_USER, max_queued=MAX_QUEUED_UPDATES, on_drop=None
+    ):
+        # The base semaphore is acquired before any per-user ordering, so it must
+        # never be the bottleneck - the real limit is self.workers. One slot above
+        # the global cap lets an update past it reach the drop check.
+        super().__init__(max_queued + 1)
+        self.max_workers = max_concurrent_updates
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued = max_queued
+        self.on_drop = on_drop
+        self.workers = None
+        self.user_locks = {}
+        self.queued = {}
+        self.total_queued = 0
+    
+    async def initialize(self):
+        self.workers = asyncio.Semaphore(self.max_workers)
+    
+    async def shutdown(self):
+        pass
+    
+    async def do_process_update(self, update, coroutine):
+        user = update.effective_user if isinstance(update, Update) else None
+        user_id = user.id if user else None
+        
+        if self.queued.get(user_id, 0) >= self.max_queued_per_user:
+            reason = "too many queued"
+        elif self.total_queued >= self.max_queued:
+            reason = "intake full"
+        else:
+            reason = None
+        
+        if reason:
+            coroutine.close()
+            logger.warning(f"Update dropped, {reason}", extra={"user_id": user_id, "event": "update_dropped"})
+            if self.on_drop and user_id is not None:
+                self.on_drop(user_id)
+            return
+        
+        self.queued[user_id] = self.queued.get(user_id, 0) + 1
+        self.total_queued += 1
+        lock = self.user_locks.setdefault(user_id, asyncio.Lock())
+        try:
+            async with lock:
+                async with self.workers:
+                    await coroutine
+        finally:
+            self.total_queued -= 1
+            self.queued[user_id] -= 1
+            if not self.queued[user_id]:
+                del self.queued[user_id]
+                del self.user_locks[user_id]
 
 class SMMBot:
-    def __init__(self):
-        self.setup_database()
+    def __init__(
+        self, db_path=DB_PATH, clock=datetime.now, http=requests, run_scheduler=True,
+        archive_path=ARCHIVE_DB_PATH, timer=time.monotonic
+    ):
+        """clock, http and timer stand in for datetime.now, requests and time.monotonic, e.g. in simulate.py"""
+        if not TOKEN_ENCRYPTION_KEY:
+            raise RuntimeError("TOKEN_ENCRYPTION_KEY is not set")
+        self.fernet = Fernet(TOKEN_ENCRYPTION_KEY)
+        self.timer = timer
+        self.token_cache = TokenCache(timer=timer)
+        self.rate_limiter = RateLimiter(timer=timer)
+        self.clock = clock
+        self.http = http
+        self.setup_database(db_path, archive_path)
         self.scheduler = BackgroundScheduler()
-        self.scheduler.start()
-        logger.info("🔄 Scheduler started")
+        self.scheduler.add_job(
+            self.dispatch_due_posts, 'interval', minutes=1,
+            id='dispatch_due_posts', max_instances=1, coalesce=True
+        )
+        self.scheduler.add_job(
+            self.archive_old_posts, 'interval', minutes=15,
+            id='archive_old_posts', max_instances=1, coalesce=True
+        )
+        if run_scheduler:
+            self.scheduler.start()
+            logger.info("🔄 Scheduler started")
     
-    def setup_database(self):
+    def setup_database(self, db_path=DB_PATH, archive_path=ARCHIVE_DB_PATH):
         """Initialize SQLite database"""
-        self.conn = sqlite3.connect('smm_bot.db', check_same_thread=False)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, uri=True)
         self.cursor = self.conn.cursor()
         
+        # Separate connection for the scheduler and keep-alive threads so their
+        # transactions never interleave with the handlers' cursor
+        self.job_conn = sqlite3.connect(db_path, check_same_thread=False, uri=True)
+        self.job_lock = Lock()
+        
+        for conn in (self.conn, self.job_conn):
+            conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+        
         # Create tables
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -120,7 +472,9 @@ class SMMBot:
                 status TEXT DEFAULT 'pending',
                 posted_at DATETIME,
                 target_channels TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                caption_preview TEXT,
+                retry_count INTEGER DEFAULT 0
             )
         ''')
         
@@ -130,20 +484,155 @@ class SMMBot:
                 posts_per_day INTEGER DEFAULT 1,
                 repost_enabled BOOLEAN DEFAULT FALSE,
                 post_times TEXT DEFAULT '["09:00"]',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                next_post_at DATETIME
             )
         ''')
         
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_posts_user_status ON posts (user_id, status)'
+        )
+        self.add_missing_column('main', 'posts', 'retry_count', 'INTEGER DEFAULT 0')
+        
+        # When each user is next due to post, NULL while the queue is empty
+        if self.add_missing_column('main', 'settings', 'next_post_at', 'DATETIME'):
+            self.cursor.execute(
+                'UPDATE settings SET next_post_at = ?',
+                (self.clock().strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_settings_next_post ON settings (next_post_at)'
+        )
+        
+        # Rollups, maintained in the same transaction that marks a post as sent
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS post_totals (
+                user_id INTEGER PRIMARY KEY,
+                posted_count INTEGER DEFAULT 0,
+                failed_count INTEGER DEFAULT 0,
+                last_sent_at DATETIME
+            )
+        ''')
+        
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS post_stats_daily (
+                user_id INTEGER,
+                channel_id INTEGER,
+                day TEXT,
+                posted_count INTEGER DEFAULT 0,
+                failed_count INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, channel_id, day)
+            )
+        ''')
+        # Stats read a date range across all of a user's channels
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_post_stats_daily_user_day ON post_stats_daily (user_id, day)'
+        )
+        
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS post_latency_daily (
+                user_id INTEGER,
+                day TEXT,
+                bucket INTEGER,
+                send_count INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, day, bucket)
+            )
+        ''')
+        
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_posts_status_posted_at ON posts (status, posted_at)'
+        )
+        
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive.posts_archive (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                content_type TEXT,
+                file_id TEXT,
+                caption TEXT,
+                status TEXT,
+                posted_at DATETIME,
+                target_channels TEXT,
+                created_at DATETIME,
+                archived_at DATETIME,
+                caption_preview TEXT
+            )
+        ''')
+        
+        # Previews for posts stored before they were rendered at ingestion
+        for schema, table in (('main', 'posts'), ('archive', 'posts_archive')):
+            if self.add_missing_column(schema, table, 'caption_preview', 'TEXT'):
+                self.cursor.execute(f'SELECT id, caption FROM {schema}.{table}')
+                self.cursor.executemany(
+                    f'UPDATE {schema}.{table} SET caption_preview = ? WHERE id = ?',
+                    [(caption_preview(caption), post_id) for post_id, caption in self.cursor.fetchall()]
+                )
+        
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS archive.idx_posts_archive_user ON posts_archive (user_id, posted_at)'
+        )
+        
         self.conn.commit()
+        self.encrypt_plaintext_tokens()
         logger.info("✅ Database initialized")
     
+    def add_missing_column(self, schema, table, column, definition):
+        """Add a column to a table created by an older version, True if it was added"""
+        self.cursor.execute(f'PRAGMA {schema}.table_info({table})')
+        if column in [row[1] for row in self.cursor.fetchall()]:
+            return False
+        self.cursor.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN {column} {definition}')
+        return True
+    
+    def encrypt_plaintext_tokens(self):
+        """Encrypt bot tokens stored before the vault existed"""
+        # Raw bot tokens contain ':', Fernet tokens never do
+        self.cursor.execute("SELECT user_id, bot_token FROM users WHERE bot_token LIKE '%:%'")
+        rows = self.cursor.fetchall()
+        for user_id, bot_token in rows:
+            self.cursor.execute(
+                'UPDATE users SET bot_token = ? WHERE user_id = ?',
+                (self.fernet.encrypt(bot_token.encode()).decode(), user_id)
+            )
+        self.conn.commit()
+        if rows:
+            logger.info(f"🔐 Encrypted {len(rows)} stored bot tokens")
+    
+    def save_bot_token(self, user_id, bot_token):
+        """Store a user's bot token encrypted and drop the cached copy"""
+        self.cursor.execute('''
+            INSERT OR REPLACE INTO users (user_id, bot_token) 
+            VALUES (?, ?)
+        ''', (user_id, self.fernet.encrypt(bot_token.encode()).decode()))
+        self.conn.commit()
+        self.token_cache.invalidate(user_id)
+    
+    def get_bot_token(self, user_id):
+        """Decrypted bot token of a user, served from the cache when possible"""
+        bot_token = self.token_cache.get(user_id)
+        if bot_token is not None:
+            return bot_token
+        
+        with self.job_lock:
+            cursor = self.job_conn.cursor()
+            cursor.execute('SELECT bot_token FROM users WHERE user_id = ?', (user_id,))
+            result = cursor.fetchone()
+        
+        if not result or not result[0]:
+            return None
+        
+        bot_token = self.fernet.decrypt(result[0].encode()).decode()
+        self.token_cache.put(user_id, bot_token)
+        return bot_token
+    
     def get_main_keyboard(self):
         """Create main menu keyboard"""
         keyboard = [
             [KeyboardButton("🤖 Setup Bot Token"), KeyboardButton("📢 Setup Channels")],
             [KeyboardButton("📤 Add Bulk Posts"), KeyboardButton("📊 Posts Per Day")],
             [KeyboardButton("✅ My Posted Posts"), KeyboardButton("⏳ Pending Posts")],
-            [KeyboardButton("🔄 Repost Mode: OFF"), KeyboardButton("🎯 Target Channels")]
+            [KeyboardButton("🔄 Repost Mode: OFF"), KeyboardButton("🎯 Target Channels")],
+            [KeyboardButton("📈 Posting Stats")]
         ]
         return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, input_field_placeholder="Choose an option...")
     
@@ -160,10 +649,12 @@ class SMMBot:
             [KeyboardButton("🤖 Setup Bot Token"), KeyboardButton("📢 Setup Channels")],
             [KeyboardButton("📤 Add Bulk Posts"), KeyboardButton("📊 Posts Per Day")],
             [KeyboardButton("✅ My Posted Posts"), KeyboardButton("⏳ Pending Posts")],
-            [KeyboardButton(f"🔄 Repost Mode: {'ON' if repost_enabled else 'OFF'}"), KeyboardButton("🎯 Target Channels")]
+            [KeyboardButton(f"🔄 Repost Mode: {'ON' if repost_enabled else 'OFF'}"), KeyboardButton("🎯 Target Channels")],
+            [KeyboardButton("📈 Posting Stats")]
         ]
         return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     
+    @with_log_context
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start command - main menu"""
         user_id = update.effective_user.id
@@ -205,6 +696,7 @@ class SMMBot:
         )
         return MAIN_MENU
     
+    @with_log_context
     async def setup_bot_token(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Setup bot token"""
         await update.message.reply_text(
@@ -220,6 +712,7 @@ class SMMBot:
         )
         return SETUP_BOT
     
+    @with_log_context
     async def handle_bot_token(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Process bot token"""
         user_id = update.effective_user.id
@@ -238,22 +731,18 @@ class SMMBot:
         # Test the bot token
         try:
             test_url = f"https://api.telegram.org/bot{bot_token}/getMe"
-            response = requests.get(test_url, timeout=10)
+            response = await asyncio.to_thread(requests.get, test_url, timeout=10)
             
             if response.status_code == 200:
                 bot_info = response.json()
                 bot_username = bot_info['result']['username']
                 
                 # Save to database
-                self.cursor.execute('''
-                    INSERT OR REPLACE INTO users (user_id, bot_token) 
-                    VALUES (?, ?)
-                ''', (user_id, bot_token))
-                self.conn.commit()
+                self.save_bot_token(user_id, bot_token)
                 
                 await update.message.reply_text(
                     f"✅ *Bot Token Verified!*\n\n"
-                    f"🤖 Bot: @{bot_username}\n"
+                    f"🤖 Bot: @{escape_markdown(bot_username)}\n"
                     f"🔐 Token: `{bot_token[:10]}...`\n\n"
                     f"*Now setup your target channels!* 📢",
                     parse_mode='Markdown',
@@ -280,6 +769,7 @@ class SMMBot:
             )
             return SETUP_BOT
     
+    @with_log_context
     async def setup_channels(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Setup target channels"""
         user_id = update.effective_user.id
@@ -315,18 +805,15 @@ class SMMBot:
         )
         return SETUP_CHANNELS
     
+    @with_log_context
+    @with_rate_limit
     async def handle_channels(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Process channel usernames"""
         user_id = update.effective_user.id
         channels_text = update.message.text.strip()
         
         # Get bot token
-        self.cursor.execute(
-            'SELECT bot_token FROM users WHERE user_id = ?', 
-            (user_id,)
-        )
-        result = self.cursor.fetchone()
-        bot_token = result[0]
+        bot_token = self.get_bot_token(user_id)
         
         channels = [ch.strip() for ch in channels_text.split('\n') if ch.strip()]
         valid_channels = []
@@ -337,7 +824,7 @@ class SMMBot:
             try:
                 test_url = f"https://api.telegram.org/bot{bot_token}/getChat"
                 payload = {"chat_id": channel}
-                response = requests.post(test_url, json=payload, timeout=10)
+                response = await asyncio.to_thread(requests.post, test_url, json=payload, timeout=10)
                 
                 if response.status_code == 200:
                     chat_info = response.json()
@@ -345,7 +832,7 @@ class SMMBot:
                     
                     # Check if bot is admin
                     admin_url = f"https://api.telegram.org/bot{bot_token}/getChatAdministrators"
-                    admin_response = requests.post(admin_url, json={"chat_id": channel}, timeout=10)
+                    admin_response = await asyncio.to_thread(requests.post, admin_url, json={"chat_id": channel}, timeout=10)
                     
                     if admin_response.status_code == 200:
                         admins = admin_response.json()['result']
@@ -359,17 +846,17 @@ class SMMBot:
                                 (user_id, channel_username, channel_title, is_active) 
                                 VALUES (?, ?, ?, ?)
                             ''', (user_id, channel, chat_title, True))
-                            valid_channels.append(f"✅ {chat_title} ({channel})")
+                            valid_channels.append(f"✅ {escape_markdown(chat_title)} ({escape_markdown(channel)})")
                         else:
-                            failed_channels.append(f"❌ {chat_title} - Bot not admin")
+                            failed_channels.append(f"❌ {escape_markdown(chat_title)} - Bot not admin")
                     else:
-                        failed_channels.append(f"❌ {channel} - Cannot check admin")
+                        failed_channels.append(f"❌ {escape_markdown(channel)} - Cannot check admin")
                 else:
-                    failed_channels.append(f"❌ {channel} - Cannot access")
+                    failed_channels.append(f"❌ {escape_markdown(channel)} - Cannot access")
                     
             except Exception as e:
                 logger.error(f"Channel validation error: {e}")
-                failed_channels.append(f"❌ {channel} - Error")
+                failed_channels.append(f"❌ {escape_markdown(channel)} - Error")
         
         self.conn.commit()
         
@@ -393,6 +880,7 @@ class SMMBot:
         )
         return MAIN_MENU
     
+    @with_log_context
     async def add_bulk_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Add bulk posts"""
         user_id = update.effective_user.id
@@ -416,7 +904,7 @@ class SMMBot:
         await update.message.reply_text(
             "📤 *Add Bulk Posts:*\n\n"
             "You can now send multiple photos/videos:\n\n"
-            "• Send as many as you want\n"
+            f"• Send as many as you want, up to {RATE_LIMIT_BURST} at a time\n"
             "• Add captions if needed\n"
             "• All will be added to queue\n"
             "• Posts will auto-distribute to channels\n\n"
@@ -426,6 +914,8 @@ class SMMBot:
         )
         return BULK_POSTS
     
+    @with_log_context
+    @with_rate_limit
     async def handle_bulk_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Process bulk media uploads"""
         user_id = update.effective_user.id
@@ -466,10 +956,11 @@ class SMMBot:
             # Save post
             self.cursor.execute('''
                 INSERT INTO posts 
-                (user_id, content_type, file_id, caption, target_channels) 
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, content_type, file_id, caption, json.dumps(channel_ids)))
+                (user_id, content_type, file_id, caption, caption_preview, target_channels) 
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, content_type, file_id, caption, caption_preview(caption), json.dumps(channel_ids)))
             self.conn.commit()
+            self.wake_user(user_id)
             
             # Get queue count
             self.cursor.execute(
@@ -495,6 +986,7 @@ class SMMBot:
         
         return BULK_POSTS
     
+    @with_log_context
     async def posts_per_day(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Set posts per day"""
         user_id = update.effective_user.id
@@ -533,6 +1025,7 @@ class SMMBot:
         )
         return POSTS_PER_DAY
     
+    @with_log_context
     async def handle_ppd_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle posts per day callback"""
         query = update.callback_query
@@ -546,6 +1039,22 @@ class SMMBot:
             'UPDATE settings SET posts_per_day = ? WHERE user_id = ?',
             (ppd, user_id)
         )
+        
+        # Re-space a scheduled user's next slot from the last post with the new
+        # interval, a parked user gets it from wake_user
+        self.cursor.execute('''
+            SELECT t.last_sent_at
+            FROM settings s
+            JOIN post_totals t ON t.user_id = s.user_id
+            WHERE s.user_id = ? AND s.next_post_at IS NOT NULL AND t.last_sent_at IS NOT NULL
+        ''', (user_id,))
+        result = self.cursor.fetchone()
+        if result:
+            next_post_at = self.next_slot_after(result[0], ppd)
+            self.cursor.execute(
+                'UPDATE settings SET next_post_at = ? WHERE user_id = ? AND next_post_at IS NOT NULL',
+                (next_post_at.strftime('%Y-%m-%d %H:%M:%S'), user_id)
+            )
         self.conn.commit()
         
         await query.edit_message_text(
@@ -556,22 +1065,19 @@ class SMMBot:
         )
         return MAIN_MENU
     
+    @with_log_context
     async def my_posted_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show posted posts"""
         user_id = update.effective_user.id
+        response_text = self.render_posted_posts(user_id)
+        keyboard = [[InlineKeyboardButton("📦 Include Archived", callback_data="history_archive")]]
         
-        self.cursor.execute('''
-            SELECT p.id, p.content_type, p.caption, p.posted_at, c.channel_title
-            FROM posts p
-            LEFT JOIN channels c ON json_extract(p.target_channels, '$[0]') = c.id
-            WHERE p.user_id = ? AND p.status = 'posted'
-            ORDER BY p.posted_at DESC
-            LIMIT 20
-        ''', (user_id,))
+        # Everything may have been archived already
+        if not response_text:
+            response_text = self.render_posted_posts(user_id, include_archive=True)
+            keyboard = []
         
-        posts = self.cursor.fetchall()
-        
-        if not posts:
+        if not response_text:
             await update.message.reply_text(
                 "📭 *No Posted Posts Yet!*\n\n"
                 "Your posted posts will appear here.\n"
@@ -581,15 +1087,56 @@ class SMMBot:
             )
             return MAIN_MENU
         
+        await update.message.reply_text(
+            response_text,
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else self.get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    @with_log_context
+    async def handle_history_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show posted posts including the archive"""
+        query = update.callback_query
+        await query.answer()
+        
+        await query.edit_message_text(
+            self.render_posted_posts(query.from_user.id, include_archive=True) or "📭 *No Posted Posts Yet!*",
+            parse_mode='Markdown'
+        )
+        return MAIN_MENU
+    
+    def render_posted_posts(self, user_id, include_archive=False):
+        """Build the posted posts list, None when there are none"""
+        source = "SELECT id, content_type, caption, caption_preview, posted_at, target_channels FROM {} WHERE user_id = ? AND status = 'posted'"
+        posts_query = source.format('main.posts')
+        params = (user_id,)
+        if include_archive:
+            posts_query += ' UNION ALL ' + source.format('archive.posts_archive')
+            params = (user_id, user_id)
+        
+        self.cursor.execute(f'''
+            SELECT p.id, p.content_type, p.caption, p.caption_preview, p.posted_at, c.channel_title
+            FROM ({posts_query}) p
+            LEFT JOIN channels c ON json_extract(p.target_channels, '$[0]') = c.id
+            ORDER BY p.posted_at DESC
+            LIMIT 20
+        ''', params)
+        
+        posts = self.cursor.fetchall()
+        
+        if not posts:
+            return None
+        
         response_text = "✅ *My Posted Posts:*\n\n"
         
         for i, post in enumerate(posts, 1):
-            post_id, content_type, caption, posted_at, channel_title = post
+            post_id, content_type, caption, preview, posted_at, channel_title = post
             emoji = "🖼️" if content_type == "photo" else "🎥" if content_type == "video" else "📄"
             time_str = datetime.strptime(posted_at, '%Y-%m-%d %H:%M:%S').strftime('%m/%d %H:%M')
             
-            caption_preview = caption[:30] + "..." if caption and len(caption) > 30 else caption or "No caption"
-            response_text += f"{i}. {emoji} {caption_preview}\n   📅 {time_str} | 📢 {channel_title or 'Unknown'}\n\n"
+            preview = preview or caption_preview(caption)
+            response_text += f"{i}. {emoji} {preview}\n   📅 {time_str} | 📢 {escape_markdown(channel_title or 'Unknown')}\n\n"
         
         self.cursor.execute(
             'SELECT COUNT(*) FROM posts WHERE user_id = ? AND status = "posted"',
@@ -597,25 +1144,30 @@ class SMMBot:
         )
         total_posted = self.cursor.fetchone()[0]
         
-        response_text += f"*Total Posted: {total_posted} posts*"
+        if include_archive:
+            self.cursor.execute(
+                'SELECT COUNT(*) FROM archive.posts_archive WHERE user_id = ? AND status = "posted"',
+                (user_id,)
+            )
+            total_archived = self.cursor.fetchone()[0]
+            response_text += f"*Total Posted: {total_posted + total_archived} posts ({total_archived} archived)*"
+        else:
+            response_text += f"*Total Posted: {total_posted} posts*"
         
-        await update.message.reply_text(
-            response_text,
-            parse_mode='Markdown',
-            reply_markup=self.get_main_keyboard()
-        )
-        return MAIN_MENU
+        return response_text
     
+    @with_log_context
     async def pending_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show pending posts"""
         user_id = update.effective_user.id
         
         self.cursor.execute('''
-            SELECT id, content_type, caption, created_at 
+            SELECT id, content_type, caption, caption_preview 
             FROM posts 
             WHERE user_id = ? AND status = 'pending'
             ORDER BY id
-        ''', (user_id,))
+            LIMIT ?
+        ''', (user_id, PENDING_PREVIEW_LIMIT))
         
         posts = self.cursor.fetchall()
         
@@ -629,16 +1181,24 @@ class SMMBot:
             )
             return MAIN_MENU
         
+        self.cursor.execute(
+            'SELECT COUNT(*) FROM posts WHERE user_id = ? AND status = "pending"',
+            (user_id,)
+        )
+        total_pending = self.cursor.fetchone()[0]
+        
         response_text = "⏳ *Pending Posts:*\n\n"
         
         for i, post in enumerate(posts, 1):
-            post_id, content_type, caption, created_at = post
+            post_id, content_type, caption, preview = post
             emoji = "🖼️" if content_type == "photo" else "🎥" if content_type == "video" else "📄"
-            
-            caption_preview = caption[:30] + "..." if caption and len(caption) > 30 else caption or "No caption"
-            response_text += f"{i}. {emoji} {caption_preview}\n"
+            response_text += f"{i}. {emoji} {preview or caption_preview(caption)}\n"
         
-        response_text += f"\n*Total Pending: {len(posts)} posts*"
+        # Long queues would go past Telegram's message size limit
+        if total_pending > len(posts):
+            response_text += f"...and {total_pending - len(posts)} more\n"
+        
+        response_text += f"\n*Total Pending: {total_pending} posts*"
         
         await update.message.reply_text(
             response_text,
@@ -647,6 +1207,7 @@ class SMMBot:
         )
         return MAIN_MENU
     
+    @with_log_context
     async def toggle_repost_mode(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Toggle repost mode"""
         user_id = update.effective_user.id
@@ -669,6 +1230,9 @@ class SMMBot:
         self.conn.commit()
         
         if new_setting:
+            # Posts archived while repost was off rejoin the cycle
+            restored = self.restore_archived_posts(user_id)
+            self.wake_user(user_id)
             message = (
                 f"🔄 *Repost Mode: ON* ✅\n\n"
                 f"*How it works:*\n"
@@ -678,6 +1242,8 @@ class SMMBot:
                 f"• Infinite loop forever! ♾️\n\n"
                 f"🔁 *Your content will auto-repeat forever*"
             )
+            if restored:
+                message += f"\n\n📦 {restored} archived posts are back in the cycle"
         else:
             message = (
                 f"🔄 *Repost Mode: OFF* ❌\n\n"
@@ -691,6 +1257,7 @@ class SMMBot:
         )
         return MAIN_MENU
     
+    @with_log_context
     async def target_channels(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show target channels"""
         user_id = update.effective_user.id
@@ -721,7 +1288,7 @@ class SMMBot:
             status = "🟢 ACTIVE" if is_active else "🔴 INACTIVE"
             if is_active:
                 active_count += 1
-            response_text += f"• {title}\n  {username} - {status}\n\n"
+            response_text += f"• {escape_markdown(title or 'Unknown')}\n  {escape_markdown(username)} - {status}\n\n"
         
         response_text += f"*Total: {active_count} active channels*"
         
@@ -732,14 +1299,424 @@ class SMMBot:
         )
         return MAIN_MENU
 
+    @with_log_context
+    async def posting_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show posting stats from the rollup tables"""
+        user_id = update.effective_user.id
+        stats = self.get_stats(user_id)
+        
+        if not stats['posted'] and not stats['failed']:
+            await update.message.reply_text(
+                "📭 *No Posting Stats Yet!*\n\n"
+                "Stats will appear here once your posts start going out.",
+                parse_mode='Markdown',
+                reply_markup=self.get_main_keyboard()
+            )
+            return MAIN_MENU
+        
+        response_text = "📈 *Posting Stats:*\n\n"
+        response_text += f"✅ Sent: *{stats['posted']}*\n"
+        response_text += f"❌ Failed: *{stats['failed']}*\n"
+        if stats['median_latency_ms'] is not None:
+            response_text += f"⚡ Median send time: *≤{stats['median_latency_ms']}ms*\n"
+        
+        response_text += "\n*📅 Last 7 Days:*\n"
+        for day in stats['daily']:
+            response_text += f"• {day['day'][5:]}: {day['posted']} sent, {day['failed']} failed\n"
+        
+        response_text += "\n*📢 Per Channel (7 days):*\n"
+        for channel in stats['channels']:
+            response_text += f"• {escape_markdown(channel['title'] or 'Unknown')}: {channel['posted']} sent, {channel['failed']} failed\n"
+        
+        await update.message.reply_text(
+            response_text,
+            parse_mode='Markdown',
+            reply_markup=self.get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    def wake_user(self, user_id):
+        """Put a user with an empty queue back on the dispatch schedule"""
+        self.cursor.execute('''
+            SELECT s.posts_per_day, t.last_sent_at
+            FROM settings s
+            LEFT JOIN post_totals t ON t.user_id = s.user_id
+            WHERE s.user_id = ? AND s.next_post_at IS NULL
+        ''', (user_id,))
+        result = self.cursor.fetchone()
+        if not result:
+            return
+        
+        # Keep the spacing to the last post
+        posts_per_day, last_sent_at = result
+        next_post_at = self.next_slot_after(last_sent_at, posts_per_day)
+        
+        self.cursor.execute(
+            'UPDATE settings SET next_post_at = ? WHERE user_id = ? AND next_post_at IS NULL',
+            (next_post_at.strftime('%Y-%m-%d %H:%M:%S'), user_id)
+        )
+        self.conn.commit()
+    
+    def next_slot_after(self, last_sent_at, posts_per_day):
+        """Earliest slot one interval after the last post, but not in the past"""
+        now = self.clock()
+        if not last_sent_at:
+            return now
+        spaced = datetime.fromisoformat(last_sent_at) + timedelta(seconds=86400 / max(posts_per_day or 1, 1))
+        return max(now, spaced)
+    
+    def dispatch_due_posts(self):
+        """Scheduler job - send the next pending post for every user that is due"""
+        now = self.clock()
+        
+        with self.job_lock:
+            cursor = self.job_conn.cursor()
+            cursor.execute('''
+                SELECT s.user_id, s.posts_per_day, s.repost_enabled, s.next_post_at
+                FROM settings s
+                JOIN users u ON u.user_id = s.user_id
+                WHERE s.next_post_at <= ? AND u.bot_token IS NOT NULL
+            ''', (now.strftime('%Y-%m-%d %H:%M:%S'),))
+            users = cursor.fetchall()
+        
+        for user_id, posts_per_day, repost_enabled, next_post_at in users:
+            token = log_context.set({"user_id": user_id, "handler": "dispatch_due_posts"})
+            try:
+                sent, retry_in = self.send_next_post(user_id, self.get_bot_token(user_id), repost_enabled)
+                self.schedule_next_post(user_id, posts_per_day, next_post_at if sent else None, retry_in)
+            except Exception as e:
+                logger.error(f"Dispatch error for user {user_id}: {e}")
+            finally:
+                log_context.reset(token)
+    
+    def schedule_next_post(self, user_id, posts_per_day, due_at, retry_in=None):
+        """Set when a user is next due, or park the user when nothing was sent"""
+        if not due_at:
+            # A post queued since the queue was found empty keeps the user scheduled
+            with self.job_lock, self.job_conn:
+                self.job_conn.execute('''
+                    UPDATE settings SET next_post_at = NULL
+                    WHERE user_id = ? AND NOT EXISTS (
+                        SELECT 1 FROM posts WHERE user_id = ? AND status = 'pending'
+                    )
+                ''', (user_id, user_id))
+            return
+        
+        # Step from the slot that was due rather than from the send time so
+        # tick delays don't add up - unless a whole interval was missed
+        interval = timedelta(seconds=86400 / max(posts_per_day or 1, 1))
+        next_post_at = datetime.fromisoformat(due_at) + interval
+        now = self.clock()
+        if retry_in:
+            next_post_at = now + timedelta(seconds=retry_in)
+        elif next_post_at <= now:
+            next_post_at = now + interval
+        
+        with self.job_lock, self.job_conn:
+            self.job_conn.execute(
+                'UPDATE settings SET next_post_at = ? WHERE user_id = ?',
+                (next_post_at.strftime('%Y-%m-%d %H:%M:%S'), user_id)
+            )
+    
+    def send_next_post(self, user_id, bot_token, repost_enabled):
+        """Send the oldest pending post of a user to its target channels.
+        
+        Returns (sent, retry_in) - sent is False when the queue was empty,
+        retry_in the seconds until the post should be retried, if at all.
+        """
+        with self.job_lock:
+            cursor = self.job_conn.cursor()
+            query = '''
+                SELECT id, content_type, file_id, caption, target_channels
+                FROM posts
+                WHERE user_id = ? AND status = 'pending'
+                ORDER BY id
+                LIMIT 1
+            '''
+            cursor.execute(query, (user_id,))
+            post = cursor.fetchone()
+            
+            # Repost mode - restart the cycle once the queue is empty
+            if not post and repost_enabled:
+                cursor.execute(
+                    "UPDATE posts SET status = 'pending', retry_count = 0 WHERE user_id = ? AND status = 'posted'",
+                    (user_id,)
+                )
+                self.job_conn.commit()
+                cursor.execute(query, (user_id,))
+                post = cursor.fetchone()
+            
+            if not post:
+                return False, None
+            
+            post_id, content_type, file_id, caption, target_channels = post
+            log_context.set({**log_context.get(), "post_id": post_id})
+            channel_ids = json.loads(target_channels or '[]')
+            cursor.execute(
+                f'SELECT id, channel_username FROM channels WHERE is_active = TRUE AND id IN ({",".join("?" * len(channel_ids))})',
+                channel_ids
+            )
+            channels = cursor.fetchall()
+        
+        results = []
+        retry_after = None
+        for channel_id, channel_username in channels:
+            started = self.timer()
+            status_code, wait = self.send_media(bot_token, channel_username, content_type, file_id, caption)
+            latency_ms = (self.timer() - started) * 1000
+            ok = status_code == 200
+            results.append((channel_id, ok, latency_ms))
+            
+            # Rate limits, server and network errors are worth another try,
+            # other errors (chat not found, bot kicked, bad file) are not
+            if not ok and (status_code is None or status_code == 429 or status_code >= 500):
+                retry_after = max(retry_after or 0, wait or 0)
+            
+            if ok:
+                logger.info(
+                    f"Sent to {channel_username}",
+                    extra={"event": "send_ok", "latency_ms": round(latency_ms), "sample_rate": SEND_LOG_SAMPLE_RATE}
+                )
+            else:
+                logger.warning(
+                    f"Send to {channel_username} failed",
+                    extra={"event": "send_failed", "latency_ms": round(latency_ms)}
+                )
+        
+        return True, self.record_post_result(user_id, post_id, results, retry_after=retry_after)
+    
+    def send_media(self, bot_token, chat_id, content_type, file_id, caption):
+        """Send one media post through the user's bot.
+        
+        Returns (status_code, retry_after) - status_code is None on network errors,
+        retry_after the wait Telegram asked for on a 429.
+        """
+        method, field = SEND_METHODS.get(content_type, SEND_METHODS["document"])
+        try:
+            response = self.http.post(
+                f"https://api.telegram.org/bot{bot_token}/{method}",
+                json={"chat_id": chat_id, field: file_id, "caption": caption},
+                timeout=10
+            )
+        except Exception as e:
+            logger.error(f"Send error: {e}")
+            return None, None
+        
+        retry_after = None
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after')
+            except ValueError:
+                pass
+        return response.status_code, retry_after
+    
+    def record_post_result(self, user_id, post_id, results, sent_at=None, retry_after=None):
+        """Mark a post as sent and update the stats rollups in the same transaction.
+        
+        A post no channel accepted stays pending while retry_after is set (the
+        failures were transient) and retries are left. Returns the seconds until
+        that retry, or None.
+        
+        Posted and failed counts are per post and channel, recorded once the post
+        is settled - attempts that end in a retry are not counted. last_sent_at
+        only moves when a channel accepted the post.
+        """
+        sent_at = (sent_at or self.clock()).strftime('%Y-%m-%d %H:%M:%S')
+        day = sent_at[:10]
+        posted = sum(1 for _, ok, _ in results if ok)
+        failed = len(results) - posted
+        last_sent_at = sent_at if posted else None
+        retry_in = None
+        
+        with self.job_lock, self.job_conn:
+            cursor = self.job_conn.cursor()
+            if not posted and retry_after is not None:
+                cursor.execute('SELECT retry_count FROM posts WHERE id = ?', (post_id,))
+                retry_count = cursor.fetchone()[0] or 0
+                if retry_count < MAX_SEND_RETRIES:
+                    retry_in = max(retry_after, SEND_RETRY_DELAY * 2 ** retry_count)
+            
+            if retry_in:
+                cursor.execute(
+                    'UPDATE posts SET retry_count = retry_count + 1 WHERE id = ?',
+                    (post_id,)
+                )
+                return retry_in
+            
+            cursor.execute(
+                'UPDATE posts SET status = ?, posted_at = ? WHERE id = ?',
+                ('posted' if posted else 'failed', sent_at, post_id)
+            )
+            
+            # Per-channel rows for the user, one channel-less row for the service
+            daily_rows = [(user_id, channel_id, day, int(ok), int(not ok)) for channel_id, ok, _ in results]
+            daily_rows.append((GLOBAL_STATS_USER, 0, day, posted, failed))
+            cursor.executemany('''
+                INSERT INTO post_stats_daily (user_id, channel_id, day, posted_count, failed_count)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, channel_id, day) DO UPDATE SET
+                    posted_count = posted_count + excluded.posted_count,
+                    failed_count = failed_count + excluded.failed_count
+            ''', daily_rows)
+            
+            latency_rows = []
+            for _, ok, latency_ms in results:
+                if ok:
+                    bucket = min(bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms), len(LATENCY_BUCKETS_MS) - 1)
+                    latency_rows += [(user_id, day, bucket), (GLOBAL_STATS_USER, day, bucket)]
+            cursor.executemany('''
+                INSERT INTO post_latency_daily (user_id, day, bucket, send_count)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT (user_id, day, bucket) DO UPDATE SET send_count = send_count + 1
+            ''', latency_rows)
+            
+            cursor.executemany('''
+                INSERT INTO post_totals (user_id, posted_count, failed_count, last_sent_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    posted_count = posted_count + excluded.posted_count,
+                    failed_count = failed_count + excluded.failed_count,
+                    last_sent_at = COALESCE(excluded.last_sent_at, last_sent_at)
+            ''', [(user_id, posted, failed, last_sent_at), (GLOBAL_STATS_USER, posted, failed, last_sent_at)])
+        
+        return None
+    
+    def archive_old_posts(self):
+        """Scheduler job - move sent posts past the retention to the archive database"""
+        cutoff = (self.clock() - timedelta(days=POST_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+        archived_at = self.clock().strftime('%Y-%m-%d %H:%M:%S')
+        columns = 'id, user_id, content_type, file_id, caption, caption_preview, status, posted_at, target_channels, created_at'
+        total = 0
+        
+        # One short transaction per batch so the posting job is never held up for long
+        for _ in range(ARCHIVE_MAX_BATCHES):
+            with self.job_lock, self.job_conn:
+                cursor = self.job_conn.cursor()
+                # Posts of users in repost mode are still part of their cycle
+                cursor.execute('''
+                    SELECT p.id FROM posts p
+                    WHERE p.status IN ('posted', 'failed') AND p.posted_at < ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM settings s WHERE s.user_id = p.user_id AND s.repost_enabled
+                    )
+                    LIMIT ?
+                ''', (cutoff, ARCHIVE_BATCH_SIZE))
+                post_ids = [row[0] for row in cursor.fetchall()]
+                if not post_ids:
+                    break
+                
+                placeholders = ','.join('?' * len(post_ids))
+                cursor.execute(f'''
+                    INSERT OR REPLACE INTO archive.posts_archive ({columns}, archived_at)
+                    SELECT {columns}, ? FROM main.posts WHERE id IN ({placeholders})
+                ''', [archived_at] + post_ids)
+                cursor.execute(f'DELETE FROM main.posts WHERE id IN ({placeholders})', post_ids)
+            total += len(post_ids)
+        
+        if total:
+            logger.info(f"📦 Archived {total} posts", extra={"event": "posts_archived"})
+        return total
+    
+    def restore_archived_posts(self, user_id):
+        """Move a user's archived sent posts back into the hot table for the repost cycle"""
+        # New ids - an archived id may have been reused in main.posts
+        columns = 'user_id, content_type, file_id, caption, caption_preview, status, posted_at, target_channels, created_at'
+        with self.conn:
+            self.cursor.execute(f'''
+                INSERT INTO main.posts ({columns})
+                SELECT {columns} FROM archive.posts_archive
+                WHERE user_id = ? AND status = 'posted'
+                ORDER BY posted_at, id
+            ''', (user_id,))
+            restored = self.cursor.rowcount
+            self.cursor.execute(
+                "DELETE FROM archive.posts_archive WHERE user_id = ? AND status = 'posted'",
+                (user_id,)
+            )
+        
+        if restored:
+            logger.info(f"📦 Restored {restored} archived posts", extra={"event": "posts_restored"})
+        return restored
+    
+    def get_stats(self, user_id, days=7):
+        """Read posting stats for the last few days from the rollup tables"""
+        since = (self.clock() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        
+        with self.job_lock:
+            cursor = self.job_conn.cursor()
+            cursor.execute(
+                'SELECT posted_count, failed_count, last_sent_at FROM post_totals WHERE user_id = ?',
+                (user_id,)
+            )
+            totals = cursor.fetchone() or (0, 0, None)
+            
+            cursor.execute('''
+                SELECT day, SUM(posted_count), SUM(failed_count)
+                FROM post_stats_daily
+                WHERE user_id = ? AND day >= ?
+                GROUP BY day
+                ORDER BY day DESC
+            ''', (user_id, since))
+            daily = cursor.fetchall()
+            
+            cursor.execute('''
+                SELECT c.channel_title, SUM(s.posted_count), SUM(s.failed_count)
+                FROM post_stats_daily s
+                LEFT JOIN channels c ON c.id = s.channel_id
+                WHERE s.user_id = ? AND s.day >= ?
+                GROUP BY s.channel_id
+                ORDER BY SUM(s.posted_count) DESC
+            ''', (user_id, since))
+            channels = cursor.fetchall()
+            
+            cursor.execute('''
+                SELECT bucket, SUM(send_count)
+                FROM post_latency_daily
+                WHERE user_id = ? AND day >= ?
+                GROUP BY bucket
+            ''', (user_id, since))
+            histogram = dict(cursor.fetchall())
+        
+        return {
+            "posted": totals[0],
+            "failed": totals[1],
+            "last_sent_at": totals[2],
+            "median_latency_ms": self.median_latency(histogram),
+            "daily": [{"day": d, "posted": p, "failed": f} for d, p, f in daily],
+            "channels": [{"title": t, "posted": p, "failed": f} for t, p, f in channels],
+        }
+    
+    def get_global_stats(self):
+        """Service-wide posting stats for the /status endpoint"""
+        stats = self.get_stats(GLOBAL_STATS_USER)
+        del stats["channels"]
+        return stats
+    
+    def median_latency(self, histogram):
+        """Upper bound (ms) of the latency bucket holding the median send"""
+        total = sum(histogram.values())
+        if not total:
+            return None
+        
+        seen = 0
+        for bucket in sorted(histogram):
+            seen += histogram[bucket]
+            if seen * 2 >= total:
+                return LATENCY_BUCKETS_MS[bucket]
+
 def run_bot():
     """Run the Telegram bot"""
+    global smm_bot_instance
     try:
         # Create bot instance
         smm_bot = SMMBot()
+        smm_bot_instance = smm_bot
         
         # Create application
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = Application.builder().token(BOT_TOKEN).concurrent_updates(
+            # Dropped updates count towards what the user is told was not saved
+            FairUpdateProcessor(on_drop=smm_bot.rate_limiter.reject)
+        ).build()
         
         # Add conversation handler
         conv_handler = ConversationHandler(
@@ -754,6 +1731,8 @@ def run_bot():
                     MessageHandler(filters.Regex('^⏳ Pending Posts$'), smm_bot.pending_posts),
                     MessageHandler(filters.Regex('^🔄 Repost Mode: (ON|OFF)$'), smm_bot.toggle_repost_mode),
                     MessageHandler(filters.Regex('^🎯 Target Channels$'), smm_bot.target_channels),
+                    MessageHandler(filters.Regex('^📈 Posting Stats$'), smm_bot.posting_stats),
+                    CallbackQueryHandler(smm_bot.handle_history_callback, pattern="^history_"),
                 ],
                 SETUP_BOT: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, smm_bot.handle_bot_token)
@@ -774,25 +1753,32 @@ def run_bot():
         
         application.add_handler(conv_handler)
         
-        print("🤖 Starting Telegram Bot...")
+        logger.info("🤖 Starting Telegram Bot...")
         application.run_polling(drop_pending_updates=True)
         
     except Exception as e:
-        print(f"❌ Bot error: {e}")
-        print("🔄 Restarting in 5 seconds...")
+        logger.error(f"❌ Bot error: {e}")
+        logger.info("🔄 Restarting in 5 seconds...")
         time.sleep(5)
         run_bot()
 
 def main():
     """Main function to start everything"""
-    print("=" * 60)
-    print("🤖 SMM AUTO-POST MASTER - SETUP ONCE, RUN FOREVER!")
-    print(f"🔐 Using Bot Token: {BOT_TOKEN[:10]}...")
-    print("📢 Multi-Channel Auto-Posting")
-    print("🔄 Repost Mode - Infinite Loop")
-    print("🎯 Complete Hands-Free Operation")
-    print("🏥 Health Check: https://smmtggbot.onrender.com/health")
-    print("=" * 60)
+    setup_logging()
+    
+    # Config errors would otherwise send run_bot into its restart loop
+    if not BOT_TOKEN:
+        logger.error("❌ BOT_TOKEN is not set")
+        sys.exit(1)
+    
+    try:
+        Fernet(TOKEN_ENCRYPTION_KEY or '')
+    except ValueError:
+        logger.error("❌ TOKEN_ENCRYPTION_KEY is missing or not a valid Fernet key")
+        sys.exit(1)
+    
+    logger.info("🤖 SMM AUTO-POST MASTER - SETUP ONCE, RUN FOREVER!")
+    logger.info("🏥 Health Check: https://smmtggbot.onrender.com/health")
     
     # Start keep-alive server
     keep_alive()